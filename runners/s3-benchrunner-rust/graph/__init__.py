@@ -1,4 +1,5 @@
 from collections import defaultdict
+from operator import itemgetter
 import time
 from typing import Any, Union
 
@@ -27,7 +28,9 @@ class Trace:
             with the following cleanup applied:
             - span["attributes"] changed into simple dict
             - span["niceName"] added
+            - span["attributesHoverData"] added, once it's been requested
         spans: list of all Spans from traces_data, sorted by start time
+        spans_by_name: dict of span name to list of Spans, sorted by start time
     """
 
     def __init__(self, json_traces_data: dict):
@@ -38,7 +41,7 @@ class Trace:
         for resource_span in self.traces_data['resourceSpans']:
             for scope_span in resource_span['scopeSpans']:
                 self.spans.extend(scope_span['spans'])
-        self.spans.sort(key=lambda x: x['startTimeUnixNano'])
+        self.spans.sort(key=itemgetter('startTimeUnixNano'))
 
         # do some data cleaning
         for span in self.spans:
@@ -47,9 +50,15 @@ class Trace:
 
         self._id_to_span = {x['spanId']: x for x in self.spans}
 
-        self._id_to_child_spans = defaultdict(list)
+        # lists of child spans end up sorted by start time, like self.spans
+        self._id_to_child_spans: dict[str, list[dict]] = defaultdict(list)
+        self.spans_by_name: dict[str, list[dict]] = defaultdict(list)
         for span in self.spans:
             self._id_to_child_spans[span['parentSpanId']].append(span)
+            self.spans_by_name[span['name']].append(span)
+
+        # cache for get_attribute_in_span_or_parent(), key is (spanId, attribute_name)
+        self._attribute_cache: dict[tuple[str, str], Any] = {}
 
     def get_span(self, id: str) -> Union[dict, None]:
         return self._id_to_span.get(id)
@@ -59,19 +68,27 @@ class Trace:
             id = span_or_id
         else:
             id = span_or_id['spanId']
-        return self._id_to_child_spans[id]
+        # use get() so that looking up leaf spans doesn't grow the defaultdict
+        return self._id_to_child_spans.get(id, [])
 
     def get_attribute_in_span_or_parent(self, span, attribute_name, default=None) -> Union[Any, None]:
         """
         Get named attribute from this span, or one of its parents.
         Useful for getting common attributes like "bucket".
+        Results are cached, since the same spans tend to get queried repeatedly.
         """
-        while span is not None:
-            if (attribute_val := span['attributes'].get(attribute_name)) is not None:
-                return attribute_val
-            span = self.get_span(span['parentSpanId'])
-
-        return default
+        cache_key = (span['spanId'], attribute_name)
+        try:
+            attribute_val = self._attribute_cache[cache_key]
+        except KeyError:
+            attribute_val = None
+            while span is not None:
+                if (attribute_val := span['attributes'].get(attribute_name)) is not None:
+                    break
+                span = self.get_span(span['parentSpanId'])
+            self._attribute_cache[cache_key] = attribute_val
+
+        return default if attribute_val is None else attribute_val
 
     @staticmethod
     def _simplify_attributes(attributes_list):
@@ -111,7 +128,12 @@ class Trace:
     @staticmethod
     def get_span_attributes_hover_data(span):
         """return span['attributes'] formatted for plotly hover_data"""
-        return "".join([f"<br>  {k}={v}" for (k, v) in span['attributes'].items()])
+        # stash it in the span, since multiple graphs show the same spans
+        if (hover_data := span.get('attributesHoverData')) is None:
+            hover_data = "".join(
+                f"<br>  {k}={v}" for (k, v) in span['attributes'].items())
+            span['attributesHoverData'] = hover_data
+        return hover_data
 
     @staticmethod
     def _nice_name(span):
@@ -1,18 +1,60 @@
-from collections import defaultdict
+from collections import Counter
+from typing import Iterable, Iterator
 import pandas as pd  # type: ignore
 import plotly.express as px  # type: ignore
 
 from . import Trace
 
+# plotly struggles to render more rows than this,
+# and they're squished too small to read anyway
+MAX_RENDER_ROWS = 2000
+
+# DataFrame columns, in the order that draw() builds each row
+COLUMNS = [
+    'Name',
+    'Nice Name',
+    'Unique Name',
+    'Start Time',
+    'End Time',
+    'Visual End Time',
+    'Duration (secs)',
+    'Span ID',
+    'Parent ID',
+    'Attributes',
+]
 
-def draw(trace: Trace):
-    # sort spans according to parent-child hierarchy
-    spans = _sort_spans_by_hierarchy(trace)
 
-    # prepare columns for plotly
-    columns = defaultdict(list)
-    name_count: dict[str, int] = defaultdict(int)
-    for (idx, span) in enumerate(spans):
+def draw(trace: Trace):
+    # iterate spans according to parent-child hierarchy
+    spans = _iter_spans_by_hierarchy(trace)
+
+    # if there are too many spans, merge some so plotly can keep up
+    if len(trace.spans) > MAX_RENDER_ROWS:
+        # divide the timeline into MAX_RENDER_ROWS bins,
+        # spans that fit together in 1 bin are too small to tell apart anyway
+        min_ns = trace.spans[0]['startTimeUnixNano']
+        max_ns = max(span['endTimeUnixNano'] for span in trace.spans)
+        bin_ns = max(1, (max_ns - min_ns) // MAX_RENDER_ROWS)
+        all_spans = list(spans)
+        aggregated_spans = list(
+            _aggregate_sibling_spans(trace, all_spans, bin_ns))
+        if len(aggregated_spans) <= MAX_RENDER_ROWS:
+            print(
+                f"NOTE: {len(all_spans)} spans aggregated into {len(aggregated_spans)} rows")
+            spans = iter(aggregated_spans)
+        else:
+            # merging any further would hide detail, and we never drop spans,
+            # so just draw them all
+            print(f"WARNING: {len(all_spans)} spans can't be aggregated into {MAX_RENDER_ROWS} rows "
+                  "without hiding detail, drawing all of them (may be slow)")
+            spans = iter(all_spans)
+
+    # prepare rows for plotly
+    # (bind hot function to local, this loop runs once per span)
+    records = []
+    name_count: Counter[str] = Counter()
+    get_hover_data = trace.get_span_attributes_hover_data
+    for span in spans:
         name = span['name']
         # nice name includes stuff like part-number
         nice_name = span['niceName']
@@ -26,28 +68,36 @@ def draw(trace: Trace):
         # ensure span is wide enough to see
         visual_end_time_ns = start_time_ns + max(duration_ns, 50_000_000)
 
-        columns['Name'].append(name)
-        columns['Nice Name'].append(nice_name)
-        columns['Unique Name'].append(unique_name)
-        columns['Start Time'].append(pd.to_datetime(start_time_ns))
-        columns['End Time'].append(pd.to_datetime(end_time_ns))
-        columns['Visual End Time'].append(pd.to_datetime(visual_end_time_ns))
-        columns['Duration (secs)'].append(duration_ns / 1_000_000_000.0)
-        columns['Span ID'].append(span['spanId'])
-        columns['Parent ID'].append(span['parentSpanId'])
-        columns['Attributes'].append(
-            trace.get_span_attributes_hover_data(span))
+        records.append((
+            name,
+            nice_name,
+            unique_name,
+            start_time_ns,
+            end_time_ns,
+            visual_end_time_ns,
+            duration_ns / 1_000_000_000.0,
+            span['spanId'],
+            span['parentSpanId'],
+            get_hover_data(span),
+        ))
+
+    df = pd.DataFrame.from_records(records, columns=COLUMNS)
 
     # if a span name occurs only once, we can just use the nice_name
-    for (i, name) in enumerate(columns['Name']):
-        if name_count[name] == 1:
-            columns['Unique Name'][i] = columns['Nice Name'][i]
+    only_once = df['Name'].map(name_count) == 1
+    df.loc[only_once, 'Unique Name'] = df.loc[only_once, 'Nice Name']
+
+    # convert nanosecond timestamps to datetimes, a whole column at a time
+    for col in ('Start Time', 'End Time', 'Visual End Time'):
+        df[col] = df[col].astype('datetime64[ns]')
 
-    df = pd.DataFrame(columns)
+    # 'Name' has lots of repeated strings, categorical dtype saves memory
+    # and speeds up plotly's color mapping
+    df['Name'] = df['Name'].astype('category')
 
     # By default, show all columns in hover text.
     # Omit a column by setting false. You can also set special formatting rules here.
-    hover_data = {col: True for col in columns.keys()}
+    hover_data = {col: True for col in COLUMNS}
     hover_data['Unique Name'] = False  # already shown
     hover_data['Visual End Time'] = False  # actual "End Time" already shown
 
@@ -65,7 +115,7 @@ def draw(trace: Trace):
     )
 
     # if there are lots of rows, ensure they're not drawn too small
-    num_rows = len(spans)
+    num_rows = len(df)
     if num_rows > 20:
         preferred_total_height = 800
         min_row_height = 3
@@ -93,29 +143,69 @@ def draw(trace: Trace):
     return fig
 
 
-def _sort_spans_by_hierarchy(trace: Trace):
-    # sort spans in depth-first order, by crawling the parent/child tree starting at root
-    sorted_spans = []
-    # ids_to_process is FIFO
-    # With each loop, we pop the last item in ids_to_process
+def _iter_spans_by_hierarchy(trace: Trace) -> Iterator[dict]:
+    # yield spans in depth-first order, by crawling the parent/child tree starting at root
+    num_spans = 0
+    # spans_to_process is LIFO
+    # With each loop, we pop the last item in spans_to_process
     # and then append its children, so that we process them next.
-    ids_to_process = ['0000000000000000']
-    while ids_to_process:
-        id = ids_to_process.pop(-1)
+    # Children are already sorted by start time, but we push them in reverse,
+    # since we pop from BACK and want earlier children to pop sooner.
+    spans_to_process = list(
+        reversed(trace.get_child_spans('0000000000000000')))
+    while spans_to_process:
+        span = spans_to_process.pop(-1)
+        num_spans += 1
+        yield span
 
-        # child_ids are already sorted by start time
-        child_ids = [child['spanId'] for child in trace.get_child_spans(id)]
-
-        # reverse child IDs before pushing into ids_to_process,
-        # since we pop from BACK and want earlier children to pop sooner
-        child_ids.reverse()
-        ids_to_process.extend(child_ids)
-
-        if (span := trace.get_span(id)) is not None:
-            sorted_spans.append(span)
+        spans_to_process.extend(reversed(trace.get_child_spans(span)))
 
     # warn if any spans are missing
-    if (num_leftover := len(trace.spans) - len(sorted_spans)):
+    if (num_leftover := len(trace.spans) - num_spans):
         print(f"WARNING: {num_leftover} spans not shown (missing parents)")
 
-    return sorted_spans
+
+def _aggregate_sibling_spans(trace: Trace, spans: Iterable[dict], bin_ns: int) -> Iterator[dict]:
+    """
+    Merge consecutive sibling spans with the same name (and no children)
+    into a single span, covering the time from the first start to the last end,
+    as long as they all fit within bin_ns of time.
+    Spans must already be ordered by hierarchy.
+    """
+    # spans in the run we're currently merging
+    run: list[dict] = []
+    run_end_ns = 0
+
+    def _merge_run() -> dict:
+        if len(run) == 1:
+            return run[0]
+        first = run[0]
+        return {
+            'name': first['name'],
+            'niceName': f"{first['name']} (x{len(run)})",
+            'spanId': first['spanId'],
+            'parentSpanId': first['parentSpanId'],
+            'startTimeUnixNano': min(x['startTimeUnixNano'] for x in run),
+            'endTimeUnixNano': max(x['endTimeUnixNano'] for x in run),
+            'attributes': {'count': len(run)},
+        }
+
+    for span in spans:
+        mergeable = not trace.get_child_spans(span)
+        if run and not (mergeable
+                        and span['name'] == run[0]['name']
+                        and span['parentSpanId'] == run[0]['parentSpanId']
+                        and (max(run_end_ns, span['endTimeUnixNano'])
+                             - run[0]['startTimeUnixNano']) <= bin_ns):
+            yield _merge_run()
+            run.clear()
+        if mergeable:
+            if run:
+                run_end_ns = max(run_end_ns, span['endTimeUnixNano'])
+            else:
+                run_end_ns = span['endTimeUnixNano']
+            run.append(span)
+        else:
+            yield span
+    if run:
+        yield _merge_run()
@@ -1,5 +1,8 @@
-from collections import defaultdict
+from collections import defaultdict, deque
 from dataclasses import dataclass
+import heapq
+import numpy
+from operator import itemgetter
 import pandas  # type: ignore
 import plotly   # type: ignore
 import plotly.express   # type: ignore
@@ -33,41 +36,37 @@ def draw(trace: Trace) -> plotly.graph_objs.Figure:
 
     requests = _gather_all_requests(trace)
 
-    columns = defaultdict(list)
-    row_end_times_ns: list[int] = []
-    for req in requests:
-        start_time_ns = req.span['startTimeUnixNano']
-        end_time_ns = req.span2['endTimeUnixNano'] if req.span2 else req.span['endTimeUnixNano']
-
-        duration_ns = end_time_ns - start_time_ns
-        visual_duration_ns = max(duration_ns, min_visual_duration_ns)
-        visual_end_time_ns = start_time_ns + visual_duration_ns
-
-        columns['Name'].append(req.span['niceName'])
-        columns['Start Time'].append(pandas.to_datetime(start_time_ns))
-        columns['End Time'].append(pandas.to_datetime(end_time_ns))
-        columns['Visual End Time'].append(visual_end_time_ns)
-        columns['Duration (secs)'].append(duration_ns / 1_000_000_000.0)
-        columns['Bucket'].append(
-            trace.get_attribute_in_span_or_parent(req.span, 'bucket', ""))
-        columns['Key'].append(
-            trace.get_attribute_in_span_or_parent(req.span, 'key', ""))
-        columns['Span ID'].append(req.span['spanId'])
-        columns['Attributes'].append(
-            trace.get_span_attributes_hover_data(req.span))
-        columns['Span ID#2'].append(req.span2['spanId'] if req.span2 else "")
-        columns['Attributes#2'].append(
-            trace.get_span_attributes_hover_data(req.span2) if req.span2 else "")
-
-        # find the first row where this request wouldn't overlap, adding a new row if necessary
-        row_i = 0
-        while row_i < len(row_end_times_ns) and row_end_times_ns[row_i] > start_time_ns:
-            row_i += 1
-        if row_i == len(row_end_times_ns):
-            row_end_times_ns.append(0)
-        row_end_times_ns[row_i] = visual_end_time_ns + gap_between_requests_ns
-
-        columns['Row'].append(row_i * 2)
+    # do the time math on whole arrays at once
+    start_times_ns = numpy.array(
+        [req.span['startTimeUnixNano'] for req in requests], dtype=numpy.int64)
+    end_times_ns = numpy.array(
+        [(req.span2 or req.span)['endTimeUnixNano'] for req in requests], dtype=numpy.int64)
+    durations_ns = end_times_ns - start_times_ns
+    visual_end_times_ns = start_times_ns + \
+        numpy.maximum(durations_ns, min_visual_duration_ns)
+
+    rows = _assign_rows(start_times_ns.tolist(),
+                        (visual_end_times_ns + gap_between_requests_ns).tolist())
+
+    columns = {
+        'Name': [req.span['niceName'] for req in requests],
+        'Start Time': start_times_ns.view('datetime64[ns]'),
+        'End Time': end_times_ns.view('datetime64[ns]'),
+        'Visual End Time': visual_end_times_ns,
+        'Duration (secs)': durations_ns / 1_000_000_000.0,
+        'Bucket': [trace.get_attribute_in_span_or_parent(req.span, 'bucket', "")
+                   for req in requests],
+        'Key': [trace.get_attribute_in_span_or_parent(req.span, 'key', "")
+                for req in requests],
+        'Span ID': [req.span['spanId'] for req in requests],
+        'Attributes': [trace.get_span_attributes_hover_data(req.span)
+                       for req in requests],
+        'Span ID#2': [req.span2['spanId'] if req.span2 else ""
+                      for req in requests],
+        'Attributes#2': [trace.get_span_attributes_hover_data(req.span2) if req.span2 else ""
+                         for req in requests],
+        'Row': [row_i * 2 for row_i in rows],
+    }
 
     df = pandas.DataFrame(columns)
 
@@ -95,6 +94,32 @@ def draw(trace: Trace) -> plotly.graph_objs.Figure:
     return fig
 
 
+def _assign_rows(start_times_ns: list[int], end_times_ns: list[int]) -> list[int]:
+    """
+    Assign each line to the first row where it wouldn't overlap, adding a new row if necessary.
+    Lines must be sorted by start time.
+    """
+    rows = []
+    # min-heap of (end_time_ns, row_i) for rows that are currently occupied
+    busy_rows: list[tuple[int, int]] = []
+    # min-heap of row_i for rows that are free
+    free_rows: list[int] = []
+    num_rows = 0
+    for start_time_ns, end_time_ns in zip(start_times_ns, end_times_ns):
+        # lines are sorted by start time, so once a row frees up it stays free until reused
+        while busy_rows and busy_rows[0][0] <= start_time_ns:
+            heapq.heappush(free_rows, heapq.heappop(busy_rows)[1])
+        if free_rows:
+            row_i = heapq.heappop(free_rows)
+        else:
+            row_i = num_rows
+            num_rows += 1
+        heapq.heappush(busy_rows, (end_time_ns, row_i))
+        rows.append(row_i)
+
+    return rows
+
+
 @dataclass
 class Request:
     span: dict
@@ -102,51 +127,52 @@ class Request:
 
 
 def _gather_all_requests(trace: Trace) -> list[Request]:
-    requests = []
+    requests: list[Request] = []
 
     # The ranged discovery HTTP request is divided into 2 spans:
     # "send-ranged-get-for-discovery" & "collect-body-from-discovery"
     # gather them all, we'll correlate them later...
-    initial_discovery_spans = []
-    body_discovery_spans = []
-
-    for span in trace.spans:
-        name = span['name']
+    # (copy these lists, since we're going to sort them)
+    initial_discovery_spans = list(
+        trace.spans_by_name.get('send-ranged-get-for-discovery', []))
+    body_discovery_spans = list(
+        trace.spans_by_name.get('collect-body-from-discovery', []))
 
+    for name, spans in trace.spans_by_name.items():
         if name == 'send-ranged-get-for-discovery':
-            initial_discovery_spans.append(span)
-        elif name == 'collect-body-from-discovery':
-            body_discovery_spans.append(span)
-        elif name.startswith('send-') or name == 'download-chunk':
+            continue
+        if name.startswith('send-') or name == 'download-chunk':
             # Simple: 1 span -> 1 HTTP request
-            requests.append(Request(span))
+            requests.extend(Request(span) for span in spans)
 
     # Correlate the ranged discovery "initial" and "body" spans, to create 1 Request
     # Sweep over "initial" spans (sorted by first-to-end)
     # Then sweep over "body" spans (sorted by first-to-start)
     # Assume they match if we find one with the same 'bucket' and 'key' attributes
-    initial_discovery_spans.sort(key=lambda x: x['endTimeUnixNano'])
-    body_discovery_spans.sort(key=lambda x: x['startTimeUnixNano'])
+    initial_discovery_spans.sort(key=itemgetter('endTimeUnixNano'))
+    body_discovery_spans.sort(key=itemgetter('startTimeUnixNano'))
+
+    # index "body" spans by (bucket, key), preserving first-to-start order
+    bucket_key_to_body_spans: dict[tuple, deque[dict]] = defaultdict(deque)
+    for body_span in body_discovery_spans:
+        bucket = trace.get_attribute_in_span_or_parent(body_span, 'bucket')
+        key = trace.get_attribute_in_span_or_parent(body_span, 'key')
+        bucket_key_to_body_spans[(bucket, key)].append(body_span)
+
     num_unmatched = 0
     for initial_span in initial_discovery_spans:
         bucket = trace.get_attribute_in_span_or_parent(initial_span, 'bucket')
         key = trace.get_attribute_in_span_or_parent(initial_span, 'key')
-        found_body_span = False
-        for i, body_span in enumerate(body_discovery_spans):
-            if bucket == trace.get_attribute_in_span_or_parent(body_span, 'bucket') \
-                    and key == trace.get_attribute_in_span_or_parent(body_span, 'key'):
-                found_body_span = True
-                break
-
-        if found_body_span:
-            requests.append(Request(initial_span, body_span))
+        if matching_body_spans := bucket_key_to_body_spans.get((bucket, key)):
             # pop "body" span so we don't correlate it with another "initial" span
-            body_discovery_spans.pop(i)
+            requests.append(
+                Request(initial_span, matching_body_spans.popleft()))
         else:
             requests.append(Request(initial_span))
             num_unmatched += 1
 
-    num_unmatched = max(num_unmatched, len(body_discovery_spans))
+    num_unmatched_body = sum(len(x) for x in bucket_key_to_body_spans.values())
+    num_unmatched = max(num_unmatched, num_unmatched_body)
     if num_unmatched > 0:
         print(
             f"WARNING: {num_unmatched} discovery spans not matched with collect-body spans")
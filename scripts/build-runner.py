@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import argparse
 from pathlib import Path
-import subprocess
+import shlex
 
 from utils import RUNNERS
 import utils.build
@@ -26,4 +26,4 @@ runner_cmd = utils.build.build_runner(
     args.lang, build_root_dir, args.branch)
 
 print("------ RUNNER_CMD ------")
-print(subprocess.list2cmdline(runner_cmd))
+print(shlex.join(runner_cmd))
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 import argparse
-import math
+import concurrent.futures
 from pathlib import Path
 import json
 import re
+import sys
 from typing import Optional
 
 from utils import WORKLOADS_DIR
@@ -21,29 +22,34 @@ PARSER.add_argument(
     'SRC_FILE', nargs='*',
     help='Path to specific workload.src.json file. ' +
     'If none specified, builds all workloads/*.src.json')
+PARSER.add_argument(
+    '--force', action='store_true',
+    help='Rebuild even if workload.run.json is newer than its workload.src.json. ' +
+    '(file times are meaningless after a git checkout, so CI uses this)')
+
+SIZE_PATTERN = re.compile(r"(\d+)(KiB|MiB|GiB|bytes|byte)$")
+SIZE_UNITS = {
+    'KiB': 1024,
+    'MiB': 1024 * 1024,
+    'GiB': 1024 * 1024 * 1024,
+    'bytes': 1,
+    'byte': 1,
+}
 
 
 def size_from_str(size_str: str) -> int:
     """
     Return size in bytes, given string like "5GiB" or "10KiB" or "1byte"
     """
-    m = re.match(r"(\d+)(KiB|MiB|GiB|bytes|byte)$", size_str)
-    if m:
-        size = int(m.group(1))
-        unit = m.group(2)
-        if unit == "KiB":
-            size *= 1024
-        elif unit == "MiB":
-            size *= 1024 * 1024
-        elif unit == "GiB":
-            size *= 1024 * 1024 * 1024
-        return size
-    else:
+    m = SIZE_PATTERN.match(size_str)
+    if not m:
         raise Exception(
             f'Illegal size "{size_str}". Expected something like "1KiB"')
 
+    return int(m.group(1)) * SIZE_UNITS[m.group(2)]
 
-def build_workload(src_file: Path):
+
+def build_workload(src_file: Path, force: bool) -> list[str]:
     """
     Read workload src JSON, which describes the workload at a high level.
     These files are meant for humans to author.
@@ -52,9 +58,14 @@ def build_workload(src_file: Path):
     Write out workload dst JSON, which fully describes the workload
     and has every field filled in so the runners can use as little code
     as possible to read and interpret them.
+
+    Skips writing dst if it's newer than both src and this script (unless force=True).
+
+    Returns list of warnings.
     """
-    with open(src_file) as f:
-        src_json = json.load(f)
+    warnings: list[str] = []
+
+    src_json = json.loads(src_file.read_bytes())
 
     # required fields
     action: str = src_json['action']
@@ -84,24 +95,30 @@ def build_workload(src_file: Path):
     # Use top-level directories named like "upload/" "download/" so that
     # users can clean an S3 bucket by deleting just 1 or 2 directories
 
-    dirname = f'{file_size_str}'
-    dirname += f'-{num_files:_}x'
-
-    if checksum:
-        dirname += f'-{checksum.lower()}'
+    checksum_str = f'-{checksum.lower()}' if checksum else ''
+    dirname = f'{file_size_str}-{num_files:_}x{checksum_str}'
 
     # suffix is anything that shouldn't go into dir name
     # (i.e. "-ram" because a download workload could use the same files in S3
     # whether or not it's downloading to ram or disk)
-    suffix = ''
-    if not files_on_disk:
-        suffix += '-ram'
+    suffix = '' if files_on_disk else '-ram'
 
     # warn if workload name doesn't match expected
     # people might just be messing around locally, so this isn't a fatal error
     expected_name = f'{action}-{dirname}{suffix}.src.json'
     if expected_name != src_file.name:
-        print(f'WARNING: "{src_file.name}" should be named "{expected_name}"')
+        warnings.append(
+            f'WARNING: "{src_file.name}" should be named "{expected_name}"')
+
+    # skip writing dst if it's already up to date
+    # (but only after validating src, so warnings show up every time)
+    dst_name = src_file.name.split('.')[0] + '.run.json'
+    dst_file = src_file.parent.joinpath(dst_name)
+    if not force and dst_file.exists():
+        dst_mtime_ns = dst_file.stat().st_mtime_ns
+        if (dst_mtime_ns > src_file.stat().st_mtime_ns
+                and dst_mtime_ns > Path(__file__).stat().st_mtime_ns):
+            return warnings
 
     # build dst workload.run.json
     dst_json = {
@@ -116,26 +133,26 @@ def build_workload(src_file: Path):
 
     # format filenames like "00001" -> "10000" for a workload with 1000 files,
     # so the names sort nicely, but aren't wider than they need to be
-    int_width = int(math.log10(num_files)) + 1
-    int_fmt = f"{{:0{int_width}}}"
-
-    for i in range(num_files):
-        filename = int_fmt.format(i + 1)
+    int_width = len(str(num_files))
+    key_prefix = f'{action}/{dirname}/'
+    key_fmt = f'%0{int_width}d'
 
-        task = {
+    # build all tasks in one go, some workloads have tens of thousands
+    dst_json['tasks'] = [
+        {
             'action': action,
-            'key': f'{action}/{dirname}/{filename}',
+            'key': key_prefix + (key_fmt % i),
             'size': file_size,
         }
-        dst_json['tasks'].append(task)
+        for i in range(1, num_files + 1)
+    ]
 
     # write file to disk
-    dst_name = src_file.name.split('.')[0] + '.run.json'
-    dst_file = src_file.parent.joinpath(dst_name)
-    with open(dst_file, 'w') as f:
-        json.dump(dst_json, f, indent=4)
-        # json.dump() doesn't add final newline
-        f.write('\n')
+    # encode whole file in memory, then write it in one go
+    # (json.dumps() doesn't add final newline)
+    dst_file.write_bytes(json.dumps(dst_json, indent=4).encode() + b'\n')
+
+    return warnings
 
 
 if __name__ == '__main__':
@@ -153,9 +170,25 @@ if __name__ == '__main__':
         if not src_files:
             exit('no workload src files found !?!')
 
-    for src_file in src_files:
-        try:
-            build_workload(src_file)
-        except Exception as e:
-            print(f'Failed building: {(str(src_file))}')
-            raise e
+    # each workload is independent, so build them in parallel
+    warnings: list[str] = []
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        future_to_src_file = {executor.submit(build_workload, src_file, args.force): src_file
+                              for src_file in src_files}
+
+        # wait for each build to complete, and ensure it was successful
+        for future in concurrent.futures.as_completed(future_to_src_file):
+            try:
+                warnings.extend(future.result())
+            except Exception as e:
+                src_file = future_to_src_file[future]
+                print(f'Failed building: {(str(src_file))}')
+
+                # cancel remaining builds
+                executor.shutdown(cancel_futures=True)
+
+                raise e
+
+    # report warnings all together at the end, rather than interleaved from worker processes
+    if warnings:
+        sys.stderr.write('\n'.join(sorted(warnings)) + '\n')
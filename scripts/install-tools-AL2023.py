@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 import argparse
+import shlex
 import shutil
+import subprocess
 import urllib.request
 
 from utils import run
@@ -19,6 +21,7 @@ run(['sudo', 'dnf', 'install', '-y',
      'git',
      'python3-pip',  # for installing python packages
      'cmake',  # for building aws-c-***
+     'ninja-build',  # for building aws-c-*** (faster than make)
      'gcc',  # for building aws-c-***
      'gcc-c++',  # for building s3-benchrunner-c
      'openssl-devel',  # for building aws-sdk-cpp
@@ -34,7 +37,14 @@ if not shutil.which('cargo'):
     # (the version in dnf is too old, in July 2024 it was the 1+ year old rust 1.68)
     # do NOT use sudo with rustup
     rustup_url = 'https://sh.rustup.rs'
-    rustup_filepath = '/tmp/rustup.sh'
-    print(f'downloading: {rustup_url} -> {rustup_filepath} ...')
-    urllib.request.urlretrieve(rustup_url, rustup_filepath)
-    run(['sh', rustup_filepath, '-y'])
+    # stream script straight from the download into sh,
+    # instead of writing it to a temp file, or reading it all into memory first
+    rustup_cmd = ['sh', '-s', '--', '-y']
+    print(f'{shlex.join(rustup_cmd)} < {rustup_url}', flush=True)
+    with urllib.request.urlopen(rustup_url) as response:
+        with subprocess.Popen(rustup_cmd, stdin=subprocess.PIPE) as p:
+            assert p.stdin is not None  # satisfy type checker
+            shutil.copyfileobj(response, p.stdin, 64 * 1024)
+            p.stdin.close()
+    if p.returncode != 0:
+        exit(f"FAILED running: {shlex.join(rustup_cmd)}")
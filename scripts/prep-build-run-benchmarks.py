@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 import argparse
 from pathlib import Path
-import subprocess
+import shlex
 import sys
 
 from utils import get_bucket_storage_class, print_banner, run, workload_paths_from_args, S3_CLIENTS, SCRIPTS_DIR
 import utils.build
 
+PREP_S3_FILES_SCRIPT = str(SCRIPTS_DIR/'prep-s3-files.py')
+RUN_BENCHMARKS_SCRIPT = str(SCRIPTS_DIR/'run-benchmarks.py')
 
 PARSER = argparse.ArgumentParser(
     description='Do-it-all script that prepares S3 files, builds runners, ' +
@@ -51,16 +53,17 @@ if __name__ == '__main__':
     build_dir = Path(args.build_dir).resolve()
     files_dir = Path(args.files_dir).resolve()
     workloads = workload_paths_from_args(args.workloads)
+    workload_args = [str(x) for x in workloads]
 
     # prepare S3 files
     for bucket in args.buckets:
         print_banner(f'PREPARE S3 FILES - {get_bucket_storage_class(bucket)}')
         run([
-            sys.executable, str(SCRIPTS_DIR/'prep-s3-files.py'),
+            sys.executable, PREP_S3_FILES_SCRIPT,
             '--bucket', bucket,
             '--region', args.region,
             '--files-dir', str(files_dir),
-            '--workloads', *[str(x) for x in workloads]
+            '--workloads', *workload_args
         ])
 
     # track which runners we've already built
@@ -75,21 +78,22 @@ if __name__ == '__main__':
             print_banner(f'BUILD RUNNER: {runner.lang}')
             runner_cmd_list = utils.build.build_runner(
                 runner.lang, build_dir, args.branch)
-            runner_cmd_str = subprocess.list2cmdline(runner_cmd_list)
+            # run-benchmarks.py parses --runner-cmd with shlex.split()
+            runner_cmd_str = shlex.join(runner_cmd_list)
             runner_lang_to_cmd[runner.lang] = runner_cmd_str
 
         for bucket in args.buckets:
             print_banner(
                 f'RUN BENCHMARKS: {get_bucket_storage_class(bucket)} - {s3_client_id}')
             run_cmd = [
-                sys.executable, str(SCRIPTS_DIR/'run-benchmarks.py'),
+                sys.executable, RUN_BENCHMARKS_SCRIPT,
                 '--runner-cmd', runner_lang_to_cmd[runner.lang],
                 '--s3-client', s3_client_id,
                 '--bucket', bucket,
                 '--region', args.region,
                 '--throughput', str(args.throughput),
                 '--files-dir', str(files_dir),
-                '--workloads', *[str(x) for x in workloads],
+                '--workloads', *workload_args,
             ]
             if args.report_metrics:
                 run_cmd += ['--report-metrics']
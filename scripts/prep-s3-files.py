@@ -1,15 +1,16 @@
 #!/usr/bin/env python3
 import argparse
 import botocore  # type: ignore
+import botocore.config  # type: ignore
 import boto3  # type: ignore
+import boto3.s3.transfer  # type: ignore
 import concurrent.futures
 from dataclasses import dataclass
+import hashlib
 import io
-import json
+import orjson
 import os
 from pathlib import Path
-import random
-import subprocess
 import time
 from typing import Optional
 
@@ -54,8 +55,8 @@ def gather_tasks(workload_filepath: Path, all_tasks: dict[str, Task]):
     We check that tasks don't "clash" with one another
     (e.g. downloading the same key twice, but expecting a different size each time).
     """
-    with open(workload_filepath) as f:
-        workload = json.load(f)
+    # workloads can have 10,000+ tasks, orjson parses them much faster
+    workload = orjson.loads(workload_filepath.read_bytes())
 
     # whether the workload will use files on disk
     files_on_disk = workload['filesOnDisk']
@@ -163,6 +164,9 @@ def prep_bucket(s3, bucket: str, region: str):
                         'DataRedundancy': 'SingleAvailabilityZone'
                     }
                 })
+        elif region == 'us-east-1':
+            # us-east-1 is the default, and S3 rejects it as an explicit LocationConstraint
+            s3.create_bucket(Bucket=bucket)
         else:
             s3.create_bucket(
                 Bucket=bucket,
@@ -199,35 +203,57 @@ class ExistingS3Object:
     checksum: Optional[str]  # checksum algorithms
 
 
-def get_existing_s3_objects(s3, bucket: str) -> dict[str, ExistingS3Object]:
-    """Get info on existing objects, so we can skip uploading ones that already exist."""
+def get_existing_s3_objects(s3, bucket: str, prefixes: set[str]) -> dict[str, ExistingS3Object]:
+    """
+    Get info on existing objects, so we can skip uploading ones that already exist.
+    Only objects under the given prefixes are listed, so we don't waste time
+    listing the (possibly huge number of) objects left behind by upload benchmarks.
+    """
     def _print_status(msg):
         print(f's3://{bucket}: {msg}')
 
     _print_status(f'Checking existing objects...')
     existing_objects: dict[str, ExistingS3Object] = {}
 
-    # list_objects_v2() is paginated, call in loop until we have all the data
-    prev_response = None
-    while prev_response is None or prev_response['IsTruncated'] is True:
-        request_kwargs = {
-            'Bucket': bucket,
-        }
-        if prev_response:
-            request_kwargs['ContinuationToken'] = prev_response['NextContinuationToken']
+    def _list_prefix(prefix: str) -> list[ExistingS3Object]:
+        # list_objects_v2() is paginated, let the paginator make the calls until we have all the data
+        objects = []
+        paginator = s3.get_paginator('list_objects_v2')
+        for response in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in response.get('Contents', []):
+                key = obj['Key']
+                size = obj['Size']
+                checksum_algorithm_list = obj.get('ChecksumAlgorithm')
+                checksum = checksum_algorithm_list[0] if checksum_algorithm_list else None
+                objects.append(ExistingS3Object(key, size, checksum))
+        return objects
+
+    # pages within a prefix must be fetched one after another,
+    # but separate prefixes can be listed in parallel
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        for objects in executor.map(_list_prefix, sorted(prefixes)):
+            for obj in objects:
+                existing_objects[obj.key] = obj
 
-        response = s3.list_objects_v2(**request_kwargs)
+    return existing_objects
 
-        for obj in response.get('Contents', []):
-            key = obj['Key']
-            size = obj['Size']
-            checksum_algorithm_list = obj.get('ChecksumAlgorithm')
-            checksum = checksum_algorithm_list[0] if checksum_algorithm_list else None
-            existing_objects[key] = ExistingS3Object(key, size, checksum)
 
-        prev_response = response
+# number of files to upload at once
+S3_MAX_WORKERS = 32
+# Settings for uploading files to S3.
+# Concurrency per upload is modest, since multiple uploads run at once.
+# Keep the default 8MiB part size: our streams aren't real files,
+# so s3transfer buffers up to max_in_memory_upload_chunks (10) parts per upload in memory,
+# and bigger parts would multiply that by S3_MAX_WORKERS uploads of multi-GiB files.
+TRANSFER_CONFIG = boto3.s3.transfer.TransferConfig(
+    max_concurrency=8,
+)
+# enough connections for every upload thread to have its own,
+# otherwise urllib3 discards connections instead of reusing them
+MAX_POOL_CONNECTIONS = S3_MAX_WORKERS * TRANSFER_CONFIG.max_concurrency
 
-    return existing_objects
+# chunk size when filling files on disk with random bytes
+RANDOM_FILL_CHUNK_SIZE = 8 * 1024 * 1024
 
 
 def prep_file_on_disk(filepath: Path, size: int):
@@ -235,9 +261,15 @@ def prep_file_on_disk(filepath: Path, size: int):
     def _print_status(msg):
         print(f'file://{str(filepath)}: {msg}')
 
-    if filepath.exists():
+    # stat() once, instead of exists() then stat()
+    try:
+        existing_size = filepath.stat().st_size
+    except FileNotFoundError:
+        existing_size = None
+
+    if existing_size is not None:
         # if the file already exists, there's no work to do
-        if filepath.stat().st_size == size:
+        if existing_size == size:
             return
         else:
             # file exists, but's it's the wrong size, delete it
@@ -249,47 +281,78 @@ def prep_file_on_disk(filepath: Path, size: int):
     filepath.parent.mkdir(parents=True, exist_ok=True)
 
     # create file
-    # using shell commands for speed, and to avoid allocating enormous buffers in python
+    # The contents must be real data, not a sparse or merely-allocated file,
+    # or reading it back wouldn't touch the disk and uploads would look faster than they are.
+    # Write to a temp file, then rename, so an interrupted run doesn't leave
+    # a full-size file that would be mistaken for a finished one.
     _print_status(f'creating file...')
-    cmd = ['head', '-c', str(size), '/dev/urandom', '>', str(filepath)]
-    cmd_str = subprocess.list2cmdline(cmd)
-    if os.system(cmd_str) != 0:
-        raise Exception(f'Failed running: {cmd_str}')
+    tmp_filepath = filepath.with_name(filepath.name + '.tmp')
+    with open(tmp_filepath, 'wb') as f:
+        # reserve all the space up front, so we fail fast if the disk is full,
+        # and the filesystem can lay the file out contiguously
+        # (posix_fallocate() isn't available on every platform, e.g. macOS)
+        if size > 0 and hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(f.fileno(), 0, size)
+
+        # fill with random bytes, in large chunks to minimize syscalls,
+        # but without allocating enormous buffers in python
+        remaining = size
+        while remaining > 0:
+            chunk_size = min(remaining, RANDOM_FILL_CHUNK_SIZE)
+            f.write(os.urandom(chunk_size))
+            remaining -= chunk_size
+
+    tmp_filepath.replace(filepath)
 
 
 class RandomFileStream(io.RawIOBase):
     """
     File-like object used to upload random bytes.
-    Use seeded random number generator (RNG) so we can regenerate the same
-    contents again after a seek.
+    Contents are generated in blocks, each seeded by the key and block index,
+    so we can regenerate the contents at any position after a seek,
+    without replaying everything before it.
     """
 
+    BLOCK_SIZE = 1024 * 1024
+
     def __init__(self, task):
         super().__init__()
         self._task = task
         self._pos = 0
-        # seed random number generator with key
-        self._rng = random.Random(task.key)
-        self._rng_pos = 0
+        # most recently generated block (reads are usually sequential)
+        self._block_index = -1
+        self._block = memoryview(b'')
+
+    def _get_block(self, block_index: int) -> memoryview:
+        if block_index != self._block_index:
+            # SHAKE is an extendable-output hash: a fast, seekable, reproducible
+            # source of random-looking bytes, implemented in C.
+            # Don't generate past the end of the file.
+            block_size = min(self.BLOCK_SIZE,
+                             self._task.size - block_index * self.BLOCK_SIZE)
+            seed = f'{self._task.key}/{block_index}'.encode()
+            self._block = memoryview(
+                hashlib.shake_128(seed).digest(block_size))
+            self._block_index = block_index
+        return self._block
 
     def readinto(self, b):
         assert self._pos >= 0 and self._pos <= self._task.size
 
-        # if seek happened, reset generator and get back to current position
-        if self._rng_pos != self._pos:
-            self._rng = random.Random(self._task.key)
-            self._rng_pos = self._pos
-            if self._rng_pos > 0:
-                self._rng.randbytes(self._rng_pos)
-
         # figure out amount to read
         remaining = self._task.size - self._pos
         amount = min(remaining, len(b))
 
-        if amount > 0:
-            b[:] = self._rng.randbytes(amount)
-            self._pos += amount
-            self._rng_pos += amount
+        # copy from as many blocks as necessary
+        with memoryview(b) as dst:
+            dst_pos = 0
+            while dst_pos < amount:
+                block_index, block_offset = divmod(self._pos, self.BLOCK_SIZE)
+                block = self._get_block(block_index)
+                n = min(amount - dst_pos, len(block) - block_offset)
+                dst[dst_pos:dst_pos + n] = block[block_offset:block_offset + n]
+                dst_pos += n
+                self._pos += n
 
         return amount
 
@@ -355,8 +418,9 @@ def prep_file_in_s3(task: Task, s3, bucket: str, existing_s3_objects: dict[str,
         file_stream,
         bucket,
         task.key,
-        extra_args,
-        _progress_callback,
+        ExtraArgs=extra_args,
+        Callback=_progress_callback,
+        Config=TRANSFER_CONFIG,
     )
 
 
@@ -387,14 +451,19 @@ if __name__ == '__main__':
 
     workloads = workload_paths_from_args(args.workloads)
 
-    s3 = boto3.client('s3', region_name=args.region)
+    # the thread-pool below may have many uploads in flight,
+    # so allow more than botocore's default of 10 connections,
+    # and keep idle connections alive so they can be reused
+    s3 = boto3.client('s3', region_name=args.region,
+                      config=botocore.config.Config(
+                          max_pool_connections=MAX_POOL_CONNECTIONS,
+                          tcp_keepalive=True,
+                          retries={'mode': 'standard'},
+                      ))
 
     # prep bucket
     prep_bucket(s3, args.bucket, args.region)
 
-    # gather existing files in bucket
-    existing_s3_objects = get_existing_s3_objects(s3, args.bucket)
-
     # prep files_dir
     files_dir = Path(args.files_dir).resolve()  # normalize path
     files_dir.mkdir(parents=True, exist_ok=True)
@@ -408,10 +477,23 @@ if __name__ == '__main__':
             print(f'Failure while processing: {str(workload)}')
             raise e
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # use thread-pool to prepare all tasks
+    # gather existing files in bucket.
+    # only downloads need files in S3, so only list the dirs they use
+    # (e.g. "download/5GiB-1x/"), each workload has its own dir
+    download_prefixes = {''.join(task.key.rpartition('/')[:2])
+                         for task in all_tasks.values() if task.action == 'download'}
+    existing_s3_objects = get_existing_s3_objects(
+        s3, args.bucket, download_prefixes)
+
+    # Use separate thread-pools for:
+    # - creating files on disk: CPU-bound (generating random bytes), so one thread per CPU
+    # - uploading files to S3: network-bound, so lots of threads
+    # so that a few huge files on disk don't hold up all the uploads, or vice versa
+    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as disk_executor, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=S3_MAX_WORKERS) as s3_executor:
         future_to_task = {}
         for key, task in all_tasks.items():
+            executor = disk_executor if task.action == 'upload' else s3_executor
             future = executor.submit(
                 prep_task, task, files_dir, s3, args.bucket, existing_s3_objects)
             future_to_task[future] = task
@@ -426,6 +508,7 @@ if __name__ == '__main__':
                     f'Failure while processing "{task.key}" from: {str(task.first_workload_file)}')
 
                 # cancel remaining tasks
-                executor.shutdown(cancel_futures=True)
+                disk_executor.shutdown(cancel_futures=True)
+                s3_executor.shutdown(cancel_futures=True)
 
                 raise e
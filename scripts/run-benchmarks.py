@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 import argparse
-from datetime import datetime, timezone
-import os
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import shlex
+import time
 
 from utils import S3_CLIENTS, run, workload_paths_from_args
 from utils.metrics import report_metrics
@@ -47,25 +47,27 @@ parser.add_argument(
 
 args = parser.parse_args()
 
-# run each workload
+# (workload_paths_from_args() already checked that workloads exist)
 workloads = workload_paths_from_args(args.workloads)
-for workload in workloads:
-    if not workload.exists():
-        exit(f'workload not found: {str(workload)}')
 
-    files_dir = args.files_dir if args.files_dir else str(Path.cwd())
-    os.chdir(files_dir)
+files_dir = Path(args.files_dir) if args.files_dir else Path.cwd()
 
-    # split using shell-like syntax,
-    # in case runner-cmd has weird stuff like quotes, spaces, etc
-    cmd = shlex.split(args.runner_cmd)
+# split using shell-like syntax,
+# in case runner-cmd has weird stuff like quotes, spaces, etc
+runner_cmd = shlex.split(args.runner_cmd)
 
-    cmd += [args.s3_client, str(workload), args.bucket,
-            args.region, str(args.throughput)]
+# run each workload
+for workload in workloads:
+    cmd = [*runner_cmd, args.s3_client, str(workload), args.bucket,
+           args.region, str(args.throughput)]
 
+    # measure elapsed time with the monotonic clock,
+    # so the approximate per-run timestamps aren't thrown off if the wall clock jumps
     start_time = datetime.now(timezone.utc)
-    result = run(cmd, check=False, capture_output=True)
-    end_time = datetime.now(timezone.utc)
+    start_monotonic = time.monotonic()
+    result = run(cmd, check=False, capture_output=True, cwd=files_dir)
+    end_time = start_time + \
+        timedelta(seconds=time.monotonic() - start_monotonic)
 
     # reporting metrics before checking returncode
     # in case it did a few runs before failing
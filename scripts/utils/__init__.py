@@ -1,7 +1,10 @@
-import os
 from dataclasses import dataclass
+import os
 from pathlib import Path
+import selectors
+import shlex
 import subprocess
+import sys
 from typing import Optional
 
 
@@ -48,27 +51,51 @@ for runner in RUNNERS.values():
         S3_CLIENTS[s3_client] = S3Client(name=s3_client, runner=runner)
 
 
+# results of scanning workloads/ dir, keyed by the dir's mtime,
+# so the scan is redone if files are added or removed
+_all_workload_paths_cache: dict[int, list[Path]] = {}
+
+
+def _all_workload_paths() -> list[Path]:
+    """Return all .run.json files in workloads/ dir"""
+    mtime_ns = WORKLOADS_DIR.stat().st_mtime_ns
+    if (cached := _all_workload_paths_cache.get(mtime_ns)) is None:
+        cached = sorted(WORKLOADS_DIR.glob('*.run.json'))
+        _all_workload_paths_cache.clear()
+        _all_workload_paths_cache[mtime_ns] = cached
+
+    # return a copy, so callers can't mess up the cache
+    return list(cached)
+
+
 def workload_paths_from_args(workloads: Optional[list[str]]) -> list[Path]:
     """
     Given --workloads arg, return list of workload paths.
     If workload is not specified, return all .run.json files in workloads/ dir.
     """
     if workloads:
-        workload_paths = [Path(x).resolve() for x in workloads]
+        # absolute() is enough, no need to resolve() symlinks component by component
+        workload_paths = [Path(x).absolute() for x in workloads]
         for workload in workload_paths:
             if not workload.exists():
                 raise Exception(f'workload not found: {str(workload)}')
     else:
-        workload_paths = sorted(WORKLOADS_DIR.glob('*.run.json'))
+        workload_paths = _all_workload_paths()
         if not workload_paths:
             raise Exception(f'no workload files found !?!')
 
     return workload_paths
 
 
-def run(cmd_args: list[str], check=True, capture_output=False) -> subprocess.CompletedProcess:
-    """Run a subprocess"""
-    print(f'{Path.cwd()}> {subprocess.list2cmdline(cmd_args)}', flush=True)
+def run(cmd_args: list[str], check=True, capture_output=False, cwd: Optional[Path] = None) -> subprocess.CompletedProcess:
+    """
+    Run a subprocess.
+    If cwd is specified, the subprocess runs in that dir
+    (our own cwd is unchanged, so this is safe to call from multiple threads).
+    """
+    # (str() each arg, since callers sometimes pass Path)
+    cmd_str = shlex.join(map(str, cmd_args))
+    print(f'{cwd or Path.cwd()}> {cmd_str}', flush=True)
 
     if capture_output:
         # Subprocess doesn't have built-in support for capturing output
@@ -76,33 +103,54 @@ def run(cmd_args: list[str], check=True, capture_output=False) -> subprocess.Com
         # We're combining stderr with stdout, for simplicity.
         with subprocess.Popen(
             cmd_args,
+            cwd=cwd,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,  # line-buffered
         ) as p:
-            lines = []
             assert p.stdout is not None  # satisfy type checker
-            for line in p.stdout:
-                lines.append(line)
-                print(line, end='', flush=True)
+            output = _drain_output(p.stdout)
 
             p.wait()  # ensure process is 100% finished
 
             completed = subprocess.CompletedProcess(
                 args=cmd_args,
                 returncode=p.returncode,
-                stdout="".join(lines),
+                stdout=output.decode(errors='replace'),
             )
     else:
         # simpler case: just run the command
-        completed = subprocess.run(cmd_args, text=True)
+        completed = subprocess.run(cmd_args, cwd=cwd, text=True)
 
     if check and completed.returncode != 0:
-        exit(f"FAILED running: {subprocess.list2cmdline(cmd_args)}")
+        exit(f"FAILED running: {cmd_str}")
     return completed
 
 
+def _drain_output(pipe) -> bytearray:
+    """
+    Read pipe until EOF, echoing data to our stdout as it comes in.
+    Reads whatever's available (instead of line by line), using a selector,
+    so this could be extended to supervise multiple processes at once.
+    """
+    output = bytearray()
+    os.set_blocking(pipe.fileno(), False)
+    with selectors.DefaultSelector() as selector:
+        selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map():
+            for key, _ in selector.select():
+                chunk = os.read(key.fd, 64 * 1024)
+                if not chunk:
+                    # EOF
+                    selector.unregister(key.fileobj)
+                    continue
+
+                output += chunk
+                sys.stdout.buffer.write(chunk)
+                sys.stdout.flush()
+
+    return output
+
+
 def fetch_git_repo(url: str, dir: Path, main_branch: str = 'main', preferred_branch: Optional[str] = None):
     """
     Ensure repo is cloned, up to date, and on the right branch.
@@ -117,33 +165,37 @@ def fetch_git_repo(url: str, dir: Path, main_branch: str = 'main', preferred_bra
     # git clone (if necessary)
     fresh_clone = not repo_dir.exists()
     if fresh_clone:
-        run(['git', 'clone', '--branch', main_branch, url, str(repo_dir)])
+        # partial clone: only fetch file contents (blobs) as they're checked out,
+        # not every version of every file in history.
+        # (not shallow, since preferred_branch could be any commit)
+        run(['git', 'clone', '--filter=blob:none',
+             '--branch', main_branch, url, str(repo_dir)])
 
-    cwd_prev = Path.cwd()
-    os.chdir(repo_dir)
+    # use "git -C <dir>" instead of changing cwd,
+    # so it's safe to fetch multiple repos at once from different threads
+    git = ['git', '-C', str(repo_dir)]
 
     # fetch latest branches (not necessary for fresh clone)
     if not fresh_clone:
-        run(['git', 'fetch'])
+        run([*git, 'fetch'])
 
     # if preferred branch specified, try to check it out...
     using_preferred_branch = False
     if preferred_branch and (preferred_branch != main_branch):
-        if run(['git', 'checkout', preferred_branch], check=False).returncode == 0:
+        if run([*git, 'checkout', preferred_branch], check=False).returncode == 0:
             using_preferred_branch = True
 
     # ...otherwise use main branch
     if not using_preferred_branch:
-        run(['git', 'checkout', main_branch])
+        run([*git, 'checkout', main_branch])
 
-    # pull latest commit (not necessary for fresh clone)
+    # fast-forward to latest commit (not necessary for fresh clone).
+    # we already fetched above, so merge instead of pull to avoid fetching twice
     if not fresh_clone:
-        run(['git', 'pull'])
+        run([*git, 'merge', '--ff-only'])
 
     # update submodules
-    run(['git', 'submodule', 'update', '--init', '--recursive'])
-
-    os.chdir(cwd_prev)
+    run([*git, 'submodule', 'update', '--init', '--recursive'])
 
 
 def print_banner(msg, *, border=5, char='*'):
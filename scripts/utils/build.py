@@ -2,15 +2,26 @@
 This code is in utils/ so multiple scripts can call it like a function.
 But scripts/build-runner.py is the main one you'd call from the terminal.
 """
+import concurrent.futures
+import json
 import os
 from pathlib import Path
+import shlex
+import shutil
+import subprocess
 import sys
-from typing import Optional
+from typing import Callable, Optional
 
 from utils import fetch_git_repo, run, RUNNERS
 
 
-def _build_cmake_proj(src_dir: Path, build_dir: Path, install_dir: Path, config_extra: list[str] = []):
+def _build_cmake_proj(src_dir: Path, build_dir: Path, install_dir: Path, config_extra: list[str] = [],
+                      parallel: Optional[int] = None, force: bool = False) -> bool:
+    """
+    Configure, build, and install a CMake project.
+    Skips the build if nothing changed since it last succeeded (unless force=True).
+    Returns True if it built, False if it was skipped.
+    """
 
     config_cmd = ['cmake',
                   '-S', str(src_dir),
@@ -20,17 +31,129 @@ def _build_cmake_proj(src_dir: Path, build_dir: Path, install_dir: Path, config_
                   f'-DCMAKE_INSTALL_PREFIX={str(install_dir)}',
                   ]
 
+    # prefer Ninja, it schedules parallel builds better than Make
+    generator = 'Ninja' if shutil.which('ninja') else None
+    if generator:
+        config_cmd += ['-G', generator]
+
+    # if ccache is installed, use it, so unchanged sources don't recompile
+    # when a build dir is reconfigured, or a dep is rebuilt from scratch
+    if shutil.which('ccache'):
+        config_cmd += ['-DCMAKE_C_COMPILER_LAUNCHER=ccache',
+                       '-DCMAKE_CXX_COMPILER_LAUNCHER=ccache']
+
     build_cmd = ['cmake',
                  '--build', str(build_dir),
-                 '--parallel', str(os.cpu_count()),
+                 '--parallel', str(parallel or os.cpu_count()),
                  '--target', 'install',
                  ]
 
     config_cmd += config_extra
 
-    run(config_cmd)
+    # The stamp file records the config used for the last successful build,
+    # and it must be newer than every source file for us to skip the build.
+    # Everything the last build installed must also still be there.
+    stamp_path = build_dir/'s3-benchrunner-build-stamp.txt'
+    stamp_contents = shlex.join(config_cmd)
+    cache_path = build_dir/'CMakeCache.txt'
+    config_unchanged = (stamp_path.exists()
+                        and stamp_path.read_text() == stamp_contents
+                        and cache_path.exists())
+    if (not force
+            and config_unchanged
+            and _installed_files_exist(build_dir)
+            and stamp_path.stat().st_mtime_ns > _newest_mtime_ns(src_dir)):
+        print(f'{src_dir.name} is up to date, skipping build')
+        return False
+
+    # Only configure if the config changed.
+    # Otherwise, the build step re-runs configure on its own
+    # if any CMake file it depends on changed.
+    if not config_unchanged:
+        # CMake refuses to reconfigure a build dir with a different generator
+        # (e.g. it was configured before ninja was installed), so start that dir fresh
+        if (generator
+                and cache_path.exists()
+                and f'CMAKE_GENERATOR:INTERNAL={generator}\n' not in cache_path.read_text()):
+            cache_path.unlink()
+            shutil.rmtree(build_dir/'CMakeFiles', ignore_errors=True)
+
+        run(config_cmd)
+
     run(build_cmd)
 
+    stamp_path.write_text(stamp_contents)
+    return True
+
+
+def _installed_files_exist(build_dir: Path) -> bool:
+    """Return True if every file listed in the build's install_manifest.txt still exists"""
+    manifest_path = build_dir/'install_manifest.txt'
+    if not manifest_path.exists():
+        return False
+    return all(os.path.exists(x) for x in manifest_path.read_text().splitlines() if x)
+
+
+def _newest_mtime_ns(dir: Path) -> int:
+    """Return newest mtime of any file under dir (ignoring .git/)"""
+    newest = 0
+    for root, dirnames, filenames in os.walk(dir):
+        if '.git' in dirnames:
+            dirnames.remove('.git')
+        for filename in filenames:
+            try:
+                newest = max(newest, os.stat(
+                    os.path.join(root, filename)).st_mtime_ns)
+            except FileNotFoundError:
+                pass  # file was deleted while we walked
+    return newest
+
+
+# prerequisites of each aws-c-*** lib, so we know which ones can build at the same time
+_C_DEP_PREREQS = {
+    'aws-c-common': [],
+    'aws-lc': [],
+    's2n': ['aws-lc'],
+    'aws-c-cal': ['aws-c-common', 'aws-lc'],
+    'aws-c-io': ['aws-c-common', 'aws-c-cal', 's2n'],
+    'aws-checksums': ['aws-c-common'],
+    'aws-c-compression': ['aws-c-common'],
+    'aws-c-http': ['aws-c-io', 'aws-c-compression'],
+    'aws-c-sdkutils': ['aws-c-common'],
+    'aws-c-auth': ['aws-c-cal', 'aws-c-http', 'aws-c-sdkutils'],
+    'aws-c-s3': ['aws-c-auth', 'aws-c-http', 'aws-checksums'],
+}
+
+# max number of aws-c-*** libs to build at the same time
+_C_MAX_CONCURRENT_BUILDS = 4
+
+
+def _run_in_dependency_order(names: list[str], prereqs: dict[str, list[str]], fn: Callable[[str], None],
+                             max_workers: int):
+    """
+    Call fn(name) for each name, running several at once on a thread-pool.
+    fn(name) isn't called until fn() has completed for all of its prereqs.
+    """
+    # prereqs that haven't completed yet (ignoring any that aren't in names)
+    waiting = {name: set(prereqs[name]).intersection(names) for name in names}
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        running: dict[concurrent.futures.Future, str] = {}
+        while waiting or running:
+            # start everything that's ready
+            for name in [x for x, x_prereqs in waiting.items() if not x_prereqs]:
+                del waiting[name]
+                running[executor.submit(fn, name)] = name
+
+            assert running, f'circular prereqs among: {list(waiting.keys())}'
+
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                done_name = running.pop(future)
+                future.result()  # raise exception if it failed
+                for x_prereqs in waiting.values():
+                    x_prereqs.discard(done_name)
+
 
 def _build_c(work_dir: Path, branch: Optional[str]) -> list[str]:
     """build s3-benchrunner-c"""
@@ -38,43 +161,52 @@ def _build_c(work_dir: Path, branch: Optional[str]) -> list[str]:
     install_dir = work_dir/'install'
 
     # fetch and build dependencies
-    deps = [
-        'aws-c-common',
-        'aws-lc',
-        's2n',
-        'aws-c-cal',
-        'aws-c-io',
-        'aws-checksums',
-        'aws-c-compression',
-        'aws-c-http',
-        'aws-c-sdkutils',
-        'aws-c-auth',
-        'aws-c-s3',
-    ]
+    deps = list(_C_DEP_PREREQS.keys())
     if sys.platform in ['darwin', 'win32']:
         deps.remove('aws-lc')
         deps.remove('s2n')
 
-    for dep_name in deps:
-        src_dir = work_dir/dep_name
-        fetch_git_repo(url=f'https://github.com/awslabs/{dep_name}.git',
-                       dir=src_dir,
-                       preferred_branch=branch)
+    # fetch all at once, since it's mostly waiting on the network
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        fetches = [executor.submit(fetch_git_repo,
+                                   url=f'https://github.com/awslabs/{dep_name}.git',
+                                   dir=work_dir/dep_name,
+                                   preferred_branch=branch)
+                   for dep_name in deps]
+        for future in fetches:
+            future.result()  # raise exception if it failed
+
+    # build several at once, splitting the CPUs between them
+    parallel_per_build = max(1, (os.cpu_count() or 1) //
+                             _C_MAX_CONCURRENT_BUILDS)
 
-        build_dir = work_dir/f"{dep_name}-build"
+    # track which deps actually got rebuilt, so anything that uses them gets rebuilt too
+    rebuilt_deps: set[str] = set()
 
+    def _build_dep(dep_name: str):
         config_extra = ['-DBUILD_TESTING=OFF']
         if dep_name == 'aws-lc':
             config_extra += ['-DDISABLE_GO=ON',
                              '-DBUILD_LIBSSL=OFF',
                              '-DDISABLE_PERL=ON']
 
-        _build_cmake_proj(src_dir, build_dir, install_dir, config_extra)
+        # all prereqs are done by the time this runs, so it's safe to read rebuilt_deps
+        if _build_cmake_proj(src_dir=work_dir/dep_name,
+                             build_dir=work_dir/f"{dep_name}-build",
+                             install_dir=install_dir,
+                             config_extra=config_extra,
+                             parallel=parallel_per_build,
+                             force=not rebuilt_deps.isdisjoint(_C_DEP_PREREQS[dep_name])):
+            rebuilt_deps.add(dep_name)
+
+    _run_in_dependency_order(deps, _C_DEP_PREREQS, _build_dep,
+                             max_workers=_C_MAX_CONCURRENT_BUILDS)
 
     # build s3-benchrunner-c
     _build_cmake_proj(src_dir=RUNNERS['c'].dir,
                       build_dir=work_dir/'s3-benchrunner-c-build',
-                      install_dir=install_dir)
+                      install_dir=install_dir,
+                      force=bool(rebuilt_deps))
 
     # return runner cmd
     return [str(install_dir/'bin/s3-benchrunner-c')]
@@ -89,7 +221,7 @@ def _build_cpp(work_dir: Path, branch: Optional[str]) -> list[str]:
     fetch_git_repo(url='https://github.com/aws/aws-sdk-cpp.git',
                    dir=work_dir/'aws-sdk-cpp',
                    preferred_branch=branch)
-    _build_cmake_proj(
+    rebuilt_sdk = _build_cmake_proj(
         src_dir=work_dir/'aws-sdk-cpp',
         build_dir=work_dir/'aws-sdk-cpp-build',
         install_dir=install_dir,
@@ -100,23 +232,29 @@ def _build_cpp(work_dir: Path, branch: Optional[str]) -> list[str]:
     # build s3-benchrunner-cpp
     _build_cmake_proj(src_dir=RUNNERS['cpp'].dir,
                       build_dir=work_dir/'s3-benchrunner-cpp-build',
-                      install_dir=install_dir)
+                      install_dir=install_dir,
+                      force=rebuilt_sdk)
 
     # return runner cmd
     return [str(install_dir/'bin/s3-benchrunner-cpp')]
 
 
-def _fetch_and_install_python_repo(
-        url: str,
-        dir: Path,
-        main_branch: str,
-        preferred_branch: Optional[str],
-        venv_python: str):
-    fetch_git_repo(url, dir, main_branch, preferred_branch)
+# repos to install into the s3-benchrunner-python virtual env, in order: (url, main_branch)
+_PYTHON_REPOS = [
+    ('https://github.com/aws/aws-cli.git', 'v2'),
+    ('https://github.com/boto/boto3.git', 'develop'),
+    ('https://github.com/boto/s3transfer.git', 'develop'),
+    ('https://github.com/boto/botocore.git', 'develop'),
+    # install aws-crt-python
+    # NOTE: (pip complains that the newly installed 1.0.0.dev0 clashes
+    # with the version requirements from other packages, but we ignore this)
+    ('https://github.com/awslabs/aws-crt-python.git', 'main'),
+]
+
 
-    # install into virtual env
-    # use --editable so we don't need to reinstall after simple file edits
-    run([venv_python, '-m', 'pip', 'install', '--editable', str(dir)])
+def _get_git_commit(repo_dir: Path) -> str:
+    return subprocess.check_output(
+        ['git', '-C', str(repo_dir), 'rev-parse', 'HEAD'], text=True).strip()
 
 
 def _build_python(work_dir: Path, branch: Optional[str]) -> list[str]:
@@ -133,43 +271,33 @@ def _build_python(work_dir: Path, branch: Optional[str]) -> list[str]:
         # and install wheel so we can build aws-crt-python
         run([venv_python, '-m', 'pip', 'install', '--upgrade', 'pip', 'wheel'])
 
-    _fetch_and_install_python_repo(
-        url='https://github.com/aws/aws-cli.git',
-        dir=work_dir.joinpath('aws-cli'),
-        main_branch='v2',
-        preferred_branch=branch,
-        venv_python=venv_python)
-
-    _fetch_and_install_python_repo(
-        url='https://github.com/boto/boto3.git',
-        dir=work_dir.joinpath('boto3'),
-        main_branch='develop',
-        preferred_branch=branch,
-        venv_python=venv_python)
-
-    _fetch_and_install_python_repo(
-        url='https://github.com/boto/s3transfer.git',
-        dir=work_dir.joinpath('s3transfer'),
-        main_branch='develop',
-        preferred_branch=branch,
-        venv_python=venv_python)
-
-    _fetch_and_install_python_repo(
-        url='https://github.com/boto/botocore.git',
-        dir=work_dir.joinpath('botocore'),
-        main_branch='develop',
-        preferred_branch=branch,
-        venv_python=venv_python)
-
-    # install aws-crt-python
-    # NOTE: (pip complains that the newly installed 1.0.0.dev0 clashes
-    # with the version requirements from other packages, but we ignore this)
-    _fetch_and_install_python_repo(
-        url='https://github.com/awslabs/aws-crt-python.git',
-        dir=work_dir.joinpath('aws-crt-python'),
-        main_branch='main',
-        preferred_branch=branch,
-        venv_python=venv_python)
+    repo_dirs = [work_dir.joinpath(url.split('/')[-1].removesuffix('.git'))
+                 for url, _ in _PYTHON_REPOS]
+
+    # fetch all at once, since it's mostly waiting on the network
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        fetches = [executor.submit(fetch_git_repo, url, repo_dir, main_branch, branch)
+                   for (url, main_branch), repo_dir in zip(_PYTHON_REPOS, repo_dirs)]
+        for future in fetches:
+            future.result()  # raise exception if it failed
+
+    # Skip pip installs if this venv already has these exact commits installed
+    # (they're slow, aws-crt-python compiles a bunch of C code)
+    install_state = {str(x): _get_git_commit(x) for x in repo_dirs}
+    install_state_path = venv_dir.joinpath('s3-benchrunner-install-state.json')
+    if install_state_path.exists() and json.loads(install_state_path.read_text()) == install_state:
+        print('Python packages already installed at these commits, skipping pip install')
+    else:
+        # forget old state, in case we fail partway through
+        install_state_path.unlink(missing_ok=True)
+
+        # install into virtual env
+        # use --editable so we don't need to reinstall after simple file edits
+        for repo_dir in repo_dirs:
+            run([venv_python, '-m', 'pip', 'install',
+                '--editable', str(repo_dir)])
+
+        install_state_path.write_text(json.dumps(install_state, indent=4))
 
     # return command for executing the runner, using the virtual environment
     main_path = RUNNERS['python'].dir/'main.py'
@@ -184,8 +312,7 @@ def _build_java(work_dir: Path, branch: Optional[str]) -> list[str]:
     fetch_git_repo(url='https://github.com/awslabs/aws-crt-java.git',
                    dir=awscrt_src,
                    preferred_branch=branch)
-    os.chdir(str(awscrt_src))
-    run(['mvn', 'clean', 'install', '-Dmaven.test.skip'])
+    run(['mvn', 'clean', 'install', '-Dmaven.test.skip'], cwd=awscrt_src)
 
     # fetch latest aws-sdk-java-v2 and install latest SNAPSHOT version
     sdk_src = work_dir/'aws-sdk-java-v2'
@@ -193,25 +320,25 @@ def _build_java(work_dir: Path, branch: Optional[str]) -> list[str]:
                    dir=sdk_src,
                    main_branch='master',
                    preferred_branch=branch)
-    os.chdir(str(sdk_src))
     run(['mvn', 'clean', 'install',
          '--projects', ':s3-transfer-manager,:s3,:bom-internal,:bom',
          '--activate-profiles', 'quick',
          '--also-make',
+         # build independent modules in parallel (1 thread per core)
+         '--threads', '1C',
          # use locally installed version of aws-crt-java
          '-Dawscrt.version=1.0.0-SNAPSHOT',
-         ])
+         ], cwd=sdk_src)
 
     # Build runner
     runner_src = RUNNERS['java'].dir
-    os.chdir(str(runner_src))
     run(['mvn',
          'clean',
          # package along with dependencies in executable uber-java
          'package',
          # use locally installed version of aws-crt-java
          '-Dawscrt.version=1.0.0-SNAPSHOT',
-         ])
+         ], cwd=runner_src)
 
     # return command for running the jar
     jar_path = runner_src/'target/s3-benchrunner-java-1.0-SNAPSHOT.jar'
@@ -221,13 +348,12 @@ def _build_java(work_dir: Path, branch: Optional[str]) -> list[str]:
 def _build_rust(work_dir: Path, branch: Optional[str]) -> list[str]:
     """build s3-benchrunner-rust"""
     runner_src = RUNNERS['rust'].dir
-    os.chdir(runner_src)
 
     if branch:
         print("WARNING: rust runner doesn't currently support --branch")
 
     # Build runner
-    run(['cargo', 'build', '--release'])
+    run(['cargo', 'build', '--release'], cwd=runner_src)
 
     # return runner cmd
     return [str(runner_src/'target/release/s3-benchrunner-rust')]
@@ -256,11 +382,4 @@ def build_runner(lang: str, build_root_dir: Path, branch: Optional[str]) -> list
     }
     build_fn = build_functions[lang]
 
-    # restore cwd after building
-    cwd_prev = Path.cwd()
-
-    runner_cmd = build_fn(work_dir, branch)
-
-    os.chdir(cwd_prev)
-
-    return runner_cmd
+    return build_fn(work_dir, branch)
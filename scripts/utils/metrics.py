@@ -2,10 +2,25 @@ import boto3  # type: ignore
 from datetime import datetime
 from pathlib import Path
 import re
-from typing import Optional, List, Tuple
+from typing import Any, Optional, List, Tuple
 from utils import get_bucket_storage_class
 
 
+# matches a runner's per-run output line (e.g. "Run:1 Secs:8.954437 Gb/s:28.847134"),
+# capturing both numbers. Used to scan the whole output at once
+# (instead of splitting into lines and matching 2 patterns per line)
+_RUN_PATTERN = re.compile(
+    r'^Run:\d+ Secs:(\d+\.\d+) (?:.* )?Gb/s:(\d+\.\d+)', re.MULTILINE)
+
+# CloudWatch clients, keyed by region.
+# Reused across calls, so we only load the service model
+# and open the HTTPS connection once, not once per workload.
+_cloudwatch_clients: dict[str, Any] = {}
+
+# max items in a single PutMetricData request
+_MAX_METRIC_DATA_PER_REQUEST = 1000
+
+
 def report_metrics(*,
                    run_stdout: str,
                    run_start_time: datetime,
@@ -66,12 +81,18 @@ def report_metrics(*,
             'Dimensions': dimensions,
         })
 
-    print('Reporting metrics...')
-    cloudwatch_client = boto3.client('cloudwatch', region_name=region)
-    cloudwatch_client.put_metric_data(
-        Namespace='S3Benchmarks',
-        MetricData=metric_data,
-    )
+    print(f'Reporting {len(metric_data)} metrics for {workload_path.name}...')
+    if (cloudwatch_client := _cloudwatch_clients.get(region)) is None:
+        cloudwatch_client = boto3.client('cloudwatch', region_name=region)
+        _cloudwatch_clients[region] = cloudwatch_client
+
+    # send everything in as few requests as possible
+    # (maxRepeatCount is configurable, so a workload could exceed the per-request limit)
+    for i in range(0, len(metric_data), _MAX_METRIC_DATA_PER_REQUEST):
+        cloudwatch_client.put_metric_data(
+            Namespace='S3Benchmarks',
+            MetricData=metric_data[i:i + _MAX_METRIC_DATA_PER_REQUEST],
+        )
 
 
 def _give_stdout_parse_throughput_in_gigabits_and_duration_in_seconds(stdout: str) -> Tuple[List[float], List[float]]:
@@ -89,17 +110,11 @@ def _give_stdout_parse_throughput_in_gigabits_and_duration_in_seconds(stdout: st
 
     Returns ([28.847134, 28.116831, 27.612145], [8.954437, 9.180856, 9.321967])
     """
-    throughput_pattern = re.compile(r'^Run:\d+ .* Gb/s:(\d+\.\d+)')
-    duration_pattern = re.compile(r'^Run:\d+ Secs:(\d+\.\d+) .*')
     throughput_per_run = []
     duration_per_run = []
 
-    for line in stdout.splitlines():
-        throughput_match = throughput_pattern.match(line)
-        duration_match = duration_pattern.match(line)
-
-        if throughput_match and duration_match:
-            throughput_per_run.append(float(throughput_match.group(1)))
-            duration_per_run.append(float(duration_match.group(1)))
+    for match in _RUN_PATTERN.finditer(stdout):
+        duration_per_run.append(float(match.group(1)))
+        throughput_per_run.append(float(match.group(2)))
 
     return throughput_per_run, duration_per_run